@@ -1,22 +1,139 @@
-import json
+import asyncio
+import atexit
+import hashlib
+import orjson
+import re
+import sqlite3
+import tempfile
 import uuid
 from datetime import datetime
 from pathlib import Path
+from collections import OrderedDict
+import contextlib
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import os
-from flask import Flask, request, jsonify, Response, send_file
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 import openai
 import logging
-from difflib import get_close_matches
-import speech_recognition as sr
-import requests
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import ahocorasick
+from cachetools import TTLCache
+from rapidfuzz import fuzz, process
+import httpx
 from deepgram import Deepgram
-from flask_cors import CORS
 # import sounddevice as sd
 
-app = Flask(__name__)
+class OrjsonResponse(JSONResponse):
+    def render(self, content):
+        return orjson.dumps(content)
 
-CORS(app)
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    try:
+        # No loop is left to retry on, so the final save happens here or is reported as lost
+        if system._products_dirty:
+            system.save_products()
+    except OSError as e:
+        logger.error("Products Save Error", extra={"details": str(e), "further": "unsaved stock changes lost at shutdown"})
+        raise
+    finally:
+        await system._async_http.aclose()
+
+app = FastAPI(default_response_class=OrjsonResponse, lifespan=lifespan)
+
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+# Keep proxies (nginx, App Engine) from buffering or caching event streams
+SSE_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+
+# Every event is {"response": <text>}; only the JSON-escaped text changes between frames
+_SSE_PREFIX = b'data: {"response":"'
+_SSE_SUFFIX = b'"}\n\n'
+
+def _sse_frame(text):
+    return _SSE_PREFIX + orjson.dumps(text)[1:-1] + _SSE_SUFFIX
+
+SYSTEM_PROMPT = "You are a helpful customer service assistant for a store."
+RESPONSE_CACHE_SIZE = 4096
+# LLM replies kept in the database across restarts; the oldest writes are pruned past this count
+RESPONSE_DB_CACHE_SIZE = 50_000
+STREAM_CHUNK_SIZE = 50
+
+# Idle sessions are dropped after SESSION_TTL seconds; history is capped to bound prompt size
+MAX_SESSIONS = 10_000
+SESSION_TTL = 3600
+MAX_HISTORY = 20
+
+# Orders and meetings live in SQLite; <table>/<id>.json files written outside the API (older
+# records, meetings booked through the voice CLI in app.py) are imported as they appear
+DB_PATH = 'store.db'
+RECORD_TABLES = ("orders", "meetings")
+IMPORT_WORKERS = 16
+
+# "[at|for|around] H[:MM] [am|pm]", matched after dots are stripped ("a.m." -> "am")
+_STRIP_DOTS = str.maketrans('', '', '.')
+_TIME_RE = re.compile(r'(?:\b(?P<prep>at|for|around)\s+)?\b(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<period>[ap]m)?(?!\w)', re.I)
+
+def _format_time(hour, minute, period):
+    """Build the "H:MM AM/PM" form used in staff.json; a bare 24-hour value is converted."""
+    hour = int(hour)
+    if not period:
+        period = 'AM' if hour < 12 else 'PM'
+        if hour > 12:
+            hour -= 12
+    return f"{hour}:{minute or '00'} {period.upper()}"
+
+# Voice replies are synthesized sentence by sentence as the text streams in
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+TTS_CHUNK_SIZE = 4096
+TTS_TIMEOUT = 30.0
+HTTP_POOL_SIZE = 32
+
+# Words that steer handle_query; staff and product names are added to the same automaton
+INTENT_KEYWORDS = ("meeting", "order", "yes")
+
+# Stock changes within this window are written to products.json together
+PRODUCTS_SAVE_DELAY = 1.0
+
+def _atomic_write(path, data):
+    """Write bytes to a unique temp file with raw os.write calls, fsync it, then rename it over path."""
+    data = memoryview(data)
+    # A per-call name, so concurrent writers (other workers, threads) never share a temp file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+def _atomic_write_json(path, obj):
+    _atomic_write(path, orjson.dumps(obj))
+
+def _read_json(path):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def _read_record(path):
+    """Parse a legacy <table>/<id>.json record; None if it is unreadable or has no id."""
+    try:
+        record = _read_json(path)
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    return record if isinstance(record, dict) and 'id' in record else None
 
 # Setup Logger
 def make_logger(log_dir="logs", log_name="ovc", console_log=True):
@@ -26,19 +143,29 @@ def make_logger(log_dir="logs", log_name="ovc", console_log=True):
     logger = logging.getLogger(log_name)
     logger.setLevel(logging.INFO)
 
+    formatter = logging.Formatter(
+        "%(asctime)s,%(name)s,%(levelname)s,%(message)s,%(details)s,%(further)s",
+        defaults={"details": "", "further": ""}
+    )
+
     log_file = os.path.join(log_dir, f"{log_name}_{timestamp}.log")
-    fh = logging.FileHandler(log_file)
+    fh = logging.FileHandler(log_file, delay=True)
     fh.setLevel(logging.INFO)
+    fh.setFormatter(formatter)
+    handlers = [fh]
 
     if console_log:
         ch = logging.StreamHandler()
         ch.setLevel(logging.INFO)
-        formatter = logging.Formatter("%(asctime)s,%(name)s,%(levelname)s,%(message)s,%(details)s,%(further)s")
         ch.setFormatter(formatter)
-        logger.addHandler(ch)
-
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
+        handlers.append(ch)
+
+    # Request handlers only enqueue records; formatting and writes happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
     return logger
 
 logger = make_logger(console_log=True)
@@ -53,11 +180,22 @@ class CustomerServiceSystem:
         self.ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
         self.ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID")
 
-        openai.api_key = self.OPENAI_API_KEY
-        self.openai_client = openai
+        self.openai_client = openai.AsyncOpenAI(api_key=self.OPENAI_API_KEY) if self.OPENAI_API_KEY else None
 
         self.deepgram = Deepgram(self.DEEPGRAM_API_KEY) if self.DEEPGRAM_API_KEY else None
 
+        # Pooled keep-alive connections to ElevenLabs, multiplexed over HTTP/2
+        self._async_http = httpx.AsyncClient(
+            http2=True,
+            headers={
+                "Accept": "audio/mpeg",
+                "Content-Type": "application/json",
+                "xi-api-key": self.ELEVENLABS_API_KEY or ""
+            },
+            timeout=TTS_TIMEOUT,
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE)
+        )
+
         # Create directories
         for folder in ["responses", "reviews", "orders", "meetings", "audio_responses"]:
             Path(folder).mkdir(exist_ok=True)
@@ -73,167 +211,339 @@ class CustomerServiceSystem:
             {"name": "Phone", "quantity": 15}
         ])
         self.staff = self.load_json_file('staff.json', default=[])
-
-        self.conversation_states = {}
+        # Pre-encoded GET bodies; only the product list changes at runtime (see schedule_save_products)
+        self._store_info_bytes = orjson.dumps(self.store_info)
+        self._staff_bytes = orjson.dumps({"staff": self.staff})
+        self._products_bytes = orjson.dumps({"products": self.products})
+        self._staff_by_name_lower = {s['name'].lower(): s for s in self.staff}
+        # Normalized slot -> slot as written in staff.json, per staff member
+        self._staff_slots = {s['name']: {self.normalize_time(t): t for t in s['availability']} for s in self.staff}
+        self._product_names_lower = [p["name"].lower() for p in self.products]
+        self._products_dirty = False
+        self._keywords = self.build_keyword_automaton()
+
+        self.db = self.open_database(DB_PATH)
+        for table in RECORD_TABLES:
+            self.import_json_records(table)
+
+        self.conversation_states = TTLCache(maxsize=MAX_SESSIONS, ttl=SESSION_TTL)
+
+        # LLM replies keyed on (system prompt, history, prompt), mirrored to the database across restarts
+        self._resp_cache = OrderedDict()
 
     def load_json_file(self, filename, default):
         try:
-            with open(filename, 'r') as f:
-                return json.load(f)
+            with open(filename, 'rb') as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             logger.warning(f"{filename} not found. Using default values.")
             return default
 
+    def open_database(self, path):
+        db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        for table in RECORD_TABLES:
+            db.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, payload JSON, created_at TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, response TEXT)")
+        # Names of <table>/*.json files already copied in, so each file is parsed once
+        db.execute("CREATE TABLE IF NOT EXISTS imported_files (tbl TEXT, name TEXT, PRIMARY KEY (tbl, name))")
+        return db
+
+    def import_json_records(self, table):
+        """Copy records saved as <table>/<id>.json into the database; files stay where they are."""
+        done = {name for (name,) in self.db.execute("SELECT name FROM imported_files WHERE tbl = ?", (table,))}
+        paths = [entry.path for entry in os.scandir(table)
+                 if entry.is_file() and entry.name.endswith('.json') and entry.name not in done]
+        if not paths:
+            return
+        # Overlap the per-file open/read latency instead of reading one file at a time
+        with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+            records = list(pool.map(_read_record, paths))
+
+        rows, imported = [], []
+        for path, record in zip(paths, records):
+            if record is None:
+                # Not marked as imported, so it is picked up once fixed; one bad file must not stop start-up
+                logger.warning("Skipped malformed record", extra={"details": path, "further": table})
+                continue
+            rows.append((record['id'], orjson.dumps(record).decode(), record.get('created_at')))
+            imported.append((table, os.path.basename(path)))
+        # Rows first: if marking the files is interrupted, re-importing them is harmless
+        self.db.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?, ?, ?)", rows)
+        self.db.executemany("INSERT OR IGNORE INTO imported_files VALUES (?, ?)", imported)
+
+    def save_record(self, table, record):
+        self.db.execute(f"INSERT INTO {table} VALUES (?, ?, ?)", (record['id'], orjson.dumps(record).decode(), record['created_at']))
+
+    def load_records(self, table):
+        # Pick up files written since the last read; already-imported names are skipped unparsed
+        self.import_json_records(table)
+        rows = self.db.execute(f"SELECT payload FROM {table} ORDER BY created_at").fetchall()
+        return [orjson.loads(payload) for (payload,) in rows]
+
     def save_products(self):
-        with open('products.json', 'w') as f:
-            json.dump(self.products, f)
+        self._product_names_lower = [p["name"].lower() for p in self.products]
+        _atomic_write_json('products.json', self.products)
+        # Only cleared once written, so a failed save is retried by the next flush
+        self._products_dirty = False
+
+    def schedule_save_products(self):
+        """Mark the catalogue dirty and write it once PRODUCTS_SAVE_DELAY has passed."""
+        self._products_bytes = orjson.dumps({"products": self.products})
+        if not self._products_dirty:
+            self._products_dirty = True
+            asyncio.get_running_loop().call_later(PRODUCTS_SAVE_DELAY, self.flush_products)
+
+    def flush_products(self):
+        if not self._products_dirty:
+            return
+        try:
+            self.save_products()
+        except OSError as e:
+            logger.error("Products Save Error", extra={"details": str(e), "further": ""})
+            asyncio.get_running_loop().call_later(PRODUCTS_SAVE_DELAY, self.flush_products)
+
+    def build_keyword_automaton(self):
+        automaton = ahocorasick.Automaton()
+        for word in INTENT_KEYWORDS:
+            automaton.add_word(word, (word, word))
+        for name_lower in self._staff_by_name_lower:
+            automaton.add_word(name_lower, ('staff', name_lower))
+        for name_lower in self._product_names_lower:
+            automaton.add_word(name_lower, ('product', name_lower))
+        automaton.make_automaton()
+        return automaton
+
+    def scan_keywords(self, user_input):
+        """Find every keyword, staff name and product name in one pass; returns {category: [values]}."""
+        hits = {}
+        for _, (category, value) in self._keywords.iter(user_input.lower()):
+            hits.setdefault(category, []).append(value)
+        return hits
 
     def normalize_time(self, time_str):
-        time_str = time_str.lower().strip().replace('.', '').replace('  ', ' ')
-        if 'am' in time_str or 'pm' in time_str:
-            time_str = time_str.replace(' am', 'am').replace(' pm', 'pm')
-            hours = time_str.replace('am', '').replace('pm', '').strip()
-            if ':' not in hours:
-                hours = f"{hours}:00"
-            return f"{hours} {'AM' if 'am' in time_str else 'PM'}"
-        if time_str.isdigit():
-            hour = int(time_str)
-            return f"{hour}:00 AM" if hour < 12 else f"{hour-12}:00 PM" if hour > 12 else "12:00 PM"
-        return time_str.upper()
+        time_str = time_str.translate(_STRIP_DOTS).strip()
+        match = _TIME_RE.search(time_str)
+        if not match:
+            return time_str.upper()
+        return _format_time(*match.group('hour', 'minute', 'period'))
 
     def extract_time_from_text(self, text):
-        text = text.lower().split()
-        for i, word in enumerate(text):
-            if any(period in word for period in ['am', 'pm']):
-                return self.normalize_time(word)
-            if word in ['at', 'for', 'around'] and i + 1 < len(text):
-                next_word = text[i + 1]
-                if next_word.replace(':', '').replace('.', '').isdigit():
-                    return self.normalize_time(next_word if i + 2 >= len(text) or 'am' not in text[i + 2].lower() else f"{next_word} {text[i + 2]}")
+        for match in _TIME_RE.finditer(text.translate(_STRIP_DOTS)):
+            # A bare number only counts as a time after "at", "for" or "around"
+            if match.group('prep') or match.group('period'):
+                return _format_time(*match.group('hour', 'minute', 'period'))
         return None
 
     def get_conversation_state(self, session_id):
-        if session_id not in self.conversation_states:
-            self.conversation_states[session_id] = {'state': None, 'data': {}, 'history': []}
-        return self.conversation_states[session_id]
+        state = self.conversation_states.get(session_id)
+        if state is None:
+            state = {'state': None, 'data': {}, 'history': []}
+        # Re-inserting restarts the TTL, so only idle sessions expire
+        self.conversation_states[session_id] = state
+        return state
+
+    def add_assistant_turn(self, state, content):
+        state['history'].append({"role": "assistant", "content": content})
+        del state['history'][:-MAX_HISTORY]
+
+    def _response_cache_key(self, history, prompt):
+        payload = orjson.dumps([SYSTEM_PROMPT, history, prompt], option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(payload).hexdigest()
+
+    def _remember_response(self, key, text):
+        self._resp_cache[key] = text
+        self._resp_cache.move_to_end(key)
+        if len(self._resp_cache) > RESPONSE_CACHE_SIZE:
+            self._resp_cache.popitem(last=False)
+
+    def get_cached_response(self, key):
+        if key in self._resp_cache:
+            self._resp_cache.move_to_end(key)
+            return self._resp_cache[key]
+        row = self.db.execute("SELECT response FROM response_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._remember_response(key, row[0])
+        return row[0]
+
+    def store_cached_response(self, key, text):
+        # REPLACE assigns a fresh rowid, so rowid order is write order
+        cursor = self.db.execute("INSERT OR REPLACE INTO response_cache (key, response) VALUES (?, ?)", (key, text))
+        self.db.execute("DELETE FROM response_cache WHERE rowid <= ?", (cursor.lastrowid - RESPONSE_DB_CACHE_SIZE,))
+
+    async def cache_response(self, key, text):
+        self._remember_response(key, text)
+        await asyncio.to_thread(self.store_cached_response, key, text)
+
+    async def stream_literal(self, text, user_input, session_id):
+        """Stream a scripted reply without calling OpenAI, recording the turn in the history."""
+        state = self.get_conversation_state(session_id)
+        state['history'].append({"role": "user", "content": user_input})
+        for i in range(0, len(text), STREAM_CHUNK_SIZE):
+            yield text[i:i + STREAM_CHUNK_SIZE]
+        self.add_assistant_turn(state, text)
 
-    def stream_openai_response(self, prompt, session_id):
+    async def stream_openai_response(self, prompt, session_id):
         state = self.get_conversation_state(session_id)
+        cache_key = self._response_cache_key(state['history'], prompt)
+        cached = self.get_cached_response(cache_key)
+        if cached is not None:
+            async for chunk in self.stream_literal(cached, prompt, session_id):
+                yield chunk
+            return
+
         state['history'].append({"role": "user", "content": prompt})
         
-        response_stream = self.openai_client.chat.completions.create(
+        response_stream = await self.openai_client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
-                {"role": "system", "content": "You are a helpful customer service assistant for a store."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 *state['history']
             ],
             stream=True
         )
         
-        def generate():
-            full_response = ""
-            for chunk in response_stream:
-                if chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    full_response += content
-                    yield content
-            state['history'].append({"role": "assistant", "content": full_response})
-        
-        return generate
+        full_response = ""
+        async for chunk in response_stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                content = chunk.choices[0].delta.content
+                full_response += content
+                yield content
+        self.add_assistant_turn(state, full_response)
+        if full_response:
+            await self.cache_response(cache_key, full_response)
 
     def match_product(self, user_input):
-        product_names = [p["name"].lower() for p in self.products]
-        matches = get_close_matches(user_input.lower(), product_names, n=1, cutoff=0.6)
-        return matches[0] if matches else None
-
-    def generate_speech(self, text):
-        """Generate speech using ElevenLabs API and return audio file path."""
-        if not self.ELEVENLABS_API_KEY or not self.ELEVENLABS_VOICE_ID:
-            logger.error("ElevenLabs API credentials missing.")
-            return None
-        
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.ELEVENLABS_VOICE_ID}"
-        headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": self.ELEVENLABS_API_KEY
-        }
-        data = {
+        match = process.extractOne(user_input.lower(), self._product_names_lower, scorer=fuzz.WRatio, score_cutoff=60)
+        return match[0] if match else None
+
+    def speech_cache_path(self, text):
+        """Audio for identical text and voice is reused, so the file name is derived from both."""
+        key = hashlib.blake2b(f"{self.ELEVENLABS_VOICE_ID}|{text}".encode()).hexdigest()
+        return Path('audio_responses') / f"{key}.mp3"
+
+    def tts_payload(self, text):
+        return {
             "text": text,
             "model_id": "eleven_monolingual_v1",
             "voice_settings": {"stability": 0.5, "similarity_boost": 0.5}
         }
-        try:
-            response = requests.post(url, json=data, headers=headers)
-            if response.status_code == 200:
-                filename = Path('audio_responses') / f"response_{uuid.uuid4()}.mp3"
-                with open(filename, 'wb') as f:
-                    f.write(response.content)
-                logger.info("Speech generated", extra={"details": text, "further": str(filename)})
-                return filename
-            else:
+
+    async def stream_speech(self, text):
+        """Yield MP3 bytes for text from the audio cache, or as ElevenLabs produces them."""
+        filename = self.speech_cache_path(text)
+        if filename.exists():
+            yield await asyncio.to_thread(filename.read_bytes)
+            return
+
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.ELEVENLABS_VOICE_ID}/stream"
+        audio = bytearray()
+        async with self._async_http.stream("POST", url, json=self.tts_payload(text)) as response:
+            if response.status_code != 200:
                 logger.error("TTS API Error", extra={"details": response.status_code, "further": ""})
-                return None
+                response.raise_for_status()
+            async for chunk in response.aiter_bytes(TTS_CHUNK_SIZE):
+                audio += chunk
+                yield chunk
+        _atomic_write(filename, audio)
+
+    async def stream_voice_response(self, user_input, session_id):
+        """Yield MP3 audio for the reply, synthesizing each sentence while the next is generated.
+
+        Errors are logged and end the stream early, so a stream that yields nothing has failed.
+        """
+        sentences = asyncio.Queue()
+
+        async def collect_sentences():
+            buffer = ""
+            try:
+                async for chunk in await self.handle_query(user_input, session_id):
+                    buffer += chunk
+                    *complete, buffer = _SENTENCE_END_RE.split(buffer)
+                    for sentence in complete:
+                        if sentence.strip():
+                            await sentences.put(sentence)
+                if buffer.strip():
+                    await sentences.put(buffer)
+            except Exception as e:
+                logger.error("LLM Error", extra={"details": str(e), "further": session_id})
+            finally:
+                await sentences.put(None)
+
+        producer = asyncio.create_task(collect_sentences())
+        spoken = []
+        try:
+            while (sentence := await sentences.get()) is not None:
+                spoken.append(sentence)
+                async for chunk in self.stream_speech(sentence):
+                    yield chunk
+            await producer
         except Exception as e:
-            logger.error("TTS Error", extra={"details": str(e), "further": ""})
-            return None
+            logger.error("TTS Error", extra={"details": str(e), "further": session_id})
+        finally:
+            producer.cancel()
+        logger.info("Voice response generated", extra={"details": " ".join(spoken), "further": session_id})
 
-    def handle_query(self, user_input, session_id):
+    async def handle_query(self, user_input, session_id):
+        """Advance the conversation and return an async iterator over the response text."""
         state = self.get_conversation_state(session_id)
+        hits = self.scan_keywords(user_input)
         
         # Meeting Handling
-        if "meeting" in user_input.lower() and state['state'] is None:
+        if 'meeting' in hits and state['state'] is None:
             state['state'] = 'meeting_requested'
             staff_names = ", ".join([s["name"] for s in self.staff])
-            return self.stream_openai_response(f"Available staff members are: {staff_names}. Please specify who you'd like to meet with and your preferred time.", session_id)
+            return self.stream_literal(f"Available staff members are: {staff_names}. Please specify who you'd like to meet with and your preferred time.", user_input, session_id)
         
         if state['state'] == 'meeting_requested':
             if 'selected_staff' in state['data']:
                 matched_staff = state['data']['selected_staff']
                 extracted_time = self.extract_time_from_text(user_input)
                 if extracted_time:
-                    for time in matched_staff['availability']:
-                        if self.normalize_time(time) == extracted_time:
-                            meeting_id = str(uuid.uuid4())
-                            meeting_data = {
-                                'id': meeting_id,
-                                'staff': matched_staff['name'],
-                                'time': time,
-                                'created_at': datetime.now().isoformat()
-                            }
-                            with open(Path('meetings') / f'{meeting_id}.json', 'w') as f:
-                                json.dump(meeting_data, f)
-                            state['state'] = None
-                            state['data'] = {}
-                            return self.stream_openai_response(f"Great! I've scheduled your meeting with {matched_staff['name']} at {time}.", session_id)
+                    time = self._staff_slots[matched_staff['name']].get(extracted_time)
+                    if time:
+                        meeting_id = str(uuid.uuid4())
+                        meeting_data = {
+                            'id': meeting_id,
+                            'staff': matched_staff['name'],
+                            'time': time,
+                            'created_at': datetime.now().isoformat()
+                        }
+                        self.save_record('meetings', meeting_data)
+                        state['state'] = None
+                        state['data'] = {}
+                        return self.stream_literal(f"Great! I've scheduled your meeting with {matched_staff['name']} at {time}.", user_input, session_id)
                     available_times = ", ".join(matched_staff['availability'])
-                    return self.stream_openai_response(f"I couldn't match that time. Available times for {matched_staff['name']} are: {available_times}. Please specify your preferred time.", session_id)
+                    return self.stream_literal(f"I couldn't match that time. Available times for {matched_staff['name']} are: {available_times}. Please specify your preferred time.", user_input, session_id)
             else:
-                for staff in self.staff:
-                    if staff['name'].lower() in user_input.lower():
-                        state['data']['selected_staff'] = staff
-                        available_times = ", ".join(staff['availability'])
-                        return self.stream_openai_response(f"I found {staff['name']}. Their available times are: {available_times}. Please specify your preferred time.", session_id)
+                if 'staff' in hits:
+                    staff = self._staff_by_name_lower[hits['staff'][0]]
+                    state['data']['selected_staff'] = staff
+                    available_times = ", ".join(staff['availability'])
+                    return self.stream_literal(f"I found {staff['name']}. Their available times are: {available_times}. Please specify your preferred time.", user_input, session_id)
                 staff_names = ", ".join([s["name"] for s in self.staff])
-                return self.stream_openai_response(f"I couldn't find that staff member. Available staff are: {staff_names}. Please try again.", session_id)
+                return self.stream_literal(f"I couldn't find that staff member. Available staff are: {staff_names}. Please try again.", user_input, session_id)
 
         # Order Handling
-        if "order" in user_input.lower():
+        if 'order' in hits:
             if state['state'] is None:
-                matched_product = self.match_product(user_input)
+                # An exact catalogue name needs no fuzzy matching; the longest one wins, so a name
+                # contained in another ("laptop" in "laptop case") doesn't shadow it
+                matched_product = max(hits['product'], key=len) if 'product' in hits else self.match_product(user_input)
                 if matched_product:
                     state['state'] = 'confirm_product'
                     state['data']['product'] = matched_product
-                    return self.stream_openai_response(f"Did you mean {matched_product}? Please say 'yes' or 'no'.", session_id)
-                return self.stream_openai_response("We don’t have that item. Could you repeat or try something else?", session_id)
+                    return self.stream_literal(f"Did you mean {matched_product}? Please say 'yes' or 'no'.", user_input, session_id)
+                return self.stream_literal("We don’t have that item. Could you repeat or try something else?", user_input, session_id)
             
             elif state['state'] == 'confirm_product':
-                if "yes" in user_input.lower():
+                if 'yes' in hits:
                     state['state'] = 'request_quantity'
-                    return self.stream_openai_response(f"Great! How many {state['data']['product']}s would you like?", session_id)
+                    return self.stream_literal(f"Great! How many {state['data']['product']}s would you like?", user_input, session_id)
                 state['state'] = None
                 state['data'] = {}
-                return self.stream_openai_response("Okay, let’s try again. What would you like to order?", session_id)
+                return self.stream_literal("Okay, let’s try again. What would you like to order?", user_input, session_id)
             
             elif state['state'] == 'request_quantity':
                 try:
@@ -243,7 +553,7 @@ class CustomerServiceSystem:
                         if product['name'].lower() == product_name:
                             if product['quantity'] >= quantity:
                                 product['quantity'] -= quantity
-                                self.save_products()
+                                self.schedule_save_products()
                                 order_id = str(uuid.uuid4())
                                 order_data = {
                                     'id': order_id,
@@ -251,14 +561,13 @@ class CustomerServiceSystem:
                                     'quantity': quantity,
                                     'created_at': datetime.now().isoformat()
                                 }
-                                with open(Path('orders') / f'{order_id}.json', 'w') as f:
-                                    json.dump(order_data, f)
+                                self.save_record('orders', order_data)
                                 state['state'] = None
                                 state['data'] = {}
-                                return self.stream_openai_response(f"Order placed for {quantity} {product_name}(s). Anything else?", session_id)
-                            return self.stream_openai_response(f"Sorry, only {product['quantity']} {product_name}(s) available.", session_id)
+                                return self.stream_literal(f"Order placed for {quantity} {product_name}(s). Anything else?", user_input, session_id)
+                            return self.stream_literal(f"Sorry, only {product['quantity']} {product_name}(s) available.", user_input, session_id)
                 except ValueError:
-                    return self.stream_openai_response("Please provide a valid number for the quantity.", session_id)
+                    return self.stream_literal("Please provide a valid number for the quantity.", user_input, session_id)
 
         # Dynamic Responses
         return self.stream_openai_response(user_input, session_id)
@@ -267,88 +576,87 @@ class CustomerServiceSystem:
 system = CustomerServiceSystem()
 
 # API Endpoints
-@app.route('/api/query', methods=['POST'])
-def query():
-    data = request.get_json()
+@app.post('/api/query')
+async def query(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
     if not data or 'input' not in data or 'session_id' not in data:
-        return jsonify({"error": "Missing input or session_id"}), 400
+        return OrjsonResponse({"error": "Missing input or session_id"}, status_code=400)
     
     user_input = data['input']
     session_id = data['session_id']
     
-    def generate_response():
-        yield "data: " + json.dumps({"response": ""}) + "\n\n"  # Initial empty chunk
-        for chunk in system.handle_query(user_input, session_id):
-            yield "data: " + json.dumps({"response": chunk}) + "\n\n"
+    async def generate_response():
+        yield _SSE_PREFIX + _SSE_SUFFIX  # Initial empty chunk
+        async for chunk in await system.handle_query(user_input, session_id):
+            yield _sse_frame(chunk)
     
     logger.info("Text query processed", extra={"details": user_input, "further": session_id})
-    return Response(generate_response(), mimetype='text/event-stream')
+    return StreamingResponse(generate_response(), media_type='text/event-stream', headers=SSE_HEADERS)
 
-@app.route('/api/voice_query', methods=['POST'])
-def voice_query():
-    if 'audio' not in request.files or 'session_id' not in request.form:
-        return jsonify({"error": "Missing audio file or session_id"}), 400
-    
-    audio_file = request.files['audio']
-    session_id = request.form['session_id']
+@app.post('/api/voice_query')
+async def voice_query(audio: UploadFile | None = File(None), session_id: str | None = Form(None)):
+    if audio is None or session_id is None:
+        return OrjsonResponse({"error": "Missing audio file or session_id"}, status_code=400)
     
     # Transcribe audio using Deepgram
     try:
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(audio_file) as source:
-            audio = recognizer.record(source)
-        audio_data = audio.get_wav_data()
-        response = system.deepgram.transcription.sync_prerecorded(
-            {"buffer": audio_data, "mimetype": "audio/wav"},
+        audio_data = await audio.read()
+        response = await system.deepgram.transcription.prerecorded(
+            {"buffer": audio_data, "mimetype": audio.content_type or "audio/wav"},
             {"model": "nova-2", "language": "en", "smart_format": True}
         )
         user_input = response['results']['channels'][0]['alternatives'][0]['transcript'].lower()
         logger.info("Voice input transcribed", extra={"details": user_input, "further": session_id})
     except Exception as e:
         logger.error("STT Error", extra={"details": str(e), "further": session_id})
-        return jsonify({"error": "Failed to transcribe audio"}), 500
-
-    # Process query and generate speech
-    response_text = "".join(system.handle_query(user_input, session_id))
-    audio_response = system.generate_speech(response_text)
-    if audio_response:
-        logger.info("Voice response generated", extra={"details": response_text, "further": str(audio_response)})
-        return send_file(audio_response, mimetype="audio/mp3")
-    else:
-        return jsonify({"error": "Failed to generate audio response"}), 500
-
-@app.route('/api/description', methods=['GET'])
+        return OrjsonResponse({"error": "Failed to transcribe audio"}, status_code=500)
+
+    # Process query and stream speech back as it is synthesized
+    if not system.ELEVENLABS_API_KEY or not system.ELEVENLABS_VOICE_ID:
+        logger.error("ElevenLabs API credentials missing.", extra={"details": "", "further": session_id})
+        return OrjsonResponse({"error": "Failed to generate audio response"}, status_code=500)
+    # Hold the response until the first audio arrives, so a failed reply is still a 500
+    audio_stream = system.stream_voice_response(user_input, session_id)
+    try:
+        first_chunk = await anext(audio_stream)
+    except StopAsyncIteration:
+        return OrjsonResponse({"error": "Failed to generate audio response"}, status_code=500)
+
+    async def generate_audio():
+        yield first_chunk
+        async for chunk in audio_stream:
+            yield chunk
+
+    return StreamingResponse(generate_audio(), media_type="audio/mpeg")
+
+@app.get('/api/description')
 def get_description():
     """Fetch store description."""
-    return jsonify(system.store_info)
+    return Response(system._store_info_bytes, media_type='application/json')
 
-@app.route('/api/products', methods=['GET'])
+@app.get('/api/products')
 def get_products():
     """Fetch all products."""
-    return jsonify({"products": system.products})
+    return Response(system._products_bytes, media_type='application/json')
 
-@app.route('/api/orders', methods=['GET'])
+@app.get('/api/orders')
 def get_orders():
     """Fetch all orders."""
-    orders = []
-    for order_file in Path('orders').glob('*.json'):
-        with open(order_file, 'r') as f:
-            orders.append(json.load(f))
-    return jsonify({"orders": orders})
+    return {"orders": system.load_records('orders')}
 
-@app.route('/api/meetings', methods=['GET'])
+@app.get('/api/meetings')
 def get_meetings():
     """Fetch all meetings."""
-    meetings = []
-    for meeting_file in Path('meetings').glob('*.json'):
-        with open(meeting_file, 'r') as f:
-            meetings.append(json.load(f))
-    return jsonify({"meetings": meetings})
+    return {"meetings": system.load_records('meetings')}
 
-@app.route('/api/staff', methods=['GET'])
+@app.get('/api/staff')
 def get_staff():
     """Fetch all staff members."""
-    return jsonify({"staff": system.staff})
+    return Response(system._staff_bytes, media_type='application/json')
 
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    import uvicorn
+    uvicorn.run("api:app", host='0.0.0.0', port=5000)
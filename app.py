@@ -1,18 +1,126 @@
-import json
+import asyncio
+import atexit
+import contextlib
+import functools
+import hashlib
+import mmap
+import re
+import tempfile
 import uuid
+import orjson
 from datetime import datetime
 from pathlib import Path
 import os
-import requests
-import speech_recognition as sr
-import pygame
+import httpx
 from dotenv import load_dotenv
-import openai
-import time
+import ahocorasick
 import logging
-from deepgram import Deepgram
+import queue
+import threading
+import time
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor
+
+# Replies are spoken sentence by sentence so synthesis of the next overlaps playback
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+TTS_CHUNK_SIZE = 4096
+TTS_WORKERS = 2
+TTS_TIMEOUT = 30.0
+TTS_CONNECT_TIMEOUT = 2.0
+# Latency-optimized streaming of raw 16-bit mono PCM, which plays without a decoder
+TTS_SAMPLE_RATE = 22050
+TTS_PARAMS = {"optimize_streaming_latency": 3, "output_format": f"pcm_{TTS_SAMPLE_RATE}"}
+
+# Phrases that steer handle_query -> intent; staff names are added to the same automaton
+INTENT_KEYWORDS = {
+    "meeting": "meeting",
+    "about your brand": "brand",
+    "tell me about": "brand",
+    "product": "product",
+    "list": "product",
+    "order": "order",
+    "return": "return"
+}
+# When several canned intents are mentioned, the first one listed here answers
+STATIC_INTENTS = ("brand", "product", "order", "return")
+
+# Short turns that need no real answer, and the words that end the conversation
+NOOP_UTTERANCES = frozenset({"ok", "okay", "thanks", "thank you", "yeah"})
+NOOP_REPLY = "Anything else?"
+_UTTERANCE_PUNCTUATION = " .,!?"
+_EXIT_RE = re.compile(r'\b(exit|goodbye|bye|quit)\b')
+
+# JSON files at least this large are parsed through mmap
+MMAP_THRESHOLD = 1 << 20
+
+# Mixer opened once in the TTS sample format; a small buffer starts playback sooner
+MIXER_BUFFER = 512
+# Seconds past a clip's length to wait for its end event before giving up on it
+PLAYBACK_GRACE = 1.0
+
+# Free-form questions fall through to the LLM; its reply is voiced as it streams in
+LLM_MODEL = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "You are a helpful customer service assistant for a store."
+FALLBACK_REPLY = "I'm not quite sure about that. Can you clarify?"
+NO_INPUT_REPLY = "I didn't catch that, could you repeat?"
+FAREWELL = "Goodbye! Have a great day!"
+MAX_HISTORY = 20
+# A clause this long with no sentence end yet is flushed to TTS at its last space
+SENTENCE_FLUSH_CHARS = 120
+
+# Paraphrases of an earlier question asked after the same recent turns reuse its LLM reply;
+# the embedding is looked up before the completion, so it gets a short timeout and no retries
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_TIMEOUT = 1.5
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CONTEXT_TURNS = 2
+
+# Live STT: raw 16 kHz mono PCM in 20 ms frames; Deepgram detects the end of speech
+MIC_SAMPLE_RATE = 16000
+MIC_CHUNK = 320
+LISTEN_TIMEOUT = 8
+PHRASE_TIME_LIMIT = 15
+LIVE_OPTIONS = {
+    "model": "nova-2",
+    "language": "en",
+    "smart_format": True,
+    "interim_results": True,
+    "endpointing": 300,
+    "encoding": "linear16",
+    "sample_rate": MIC_SAMPLE_RATE,
+    "channels": 1
+}
+
+# Times like "at 3", "2:30pm" or "11 a.m."; rendered as "H:MM AM/PM" like staff.json
+_STRIP_DOTS = str.maketrans('', '', '.')
+_HAS_DIGIT = re.compile(r'\d').search
+_TIME_RE = re.compile(r'(?:\b(?P<prep>at|for|around)\s+)?\b(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<period>[ap]m)?(?!\w)', re.I)
+
+def _format_time(hour, minute, period):
+    """Build the "H:MM AM/PM" form used in staff.json; a bare 24-hour value is converted."""
+    hour = int(hour)
+    if not period:
+        period = 'AM' if hour < 12 else 'PM'
+        if hour > 12:
+            hour -= 12
+    return f"{hour}:{minute or '00'} {period.upper()}"
 
 # Setup Logger
+LOG_BATCH_SIZE = 64
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for the log file."""
+
+    def format(self, record):
+        return orjson.dumps({
+            "ts": record.created,
+            "lvl": record.levelname,
+            "msg": record.getMessage(),
+            "d": getattr(record, "details", None),
+            "f": getattr(record, "further", None)
+        }, default=str).decode()
+
 def make_logger(log_dir="logs", log_name="ovc", console_log=True):
     os.makedirs(log_dir, exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -21,22 +129,47 @@ def make_logger(log_dir="logs", log_name="ovc", console_log=True):
     logger.setLevel(logging.INFO)
 
     log_file = os.path.join(log_dir, f"{log_name}_{timestamp}.log")
-    fh = logging.FileHandler(log_file)
+    fh = logging.FileHandler(log_file, delay=True)
     fh.setLevel(logging.INFO)
+    fh.setFormatter(JsonFormatter())
+    # INFO lines are written in batches; a warning or error flushes the batch immediately
+    handlers = [MemoryHandler(LOG_BATCH_SIZE, flushLevel=logging.WARNING, target=fh)]
 
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-
-    formatter = logging.Formatter("%(asctime)s,%(name)s,%(levelname)s,%(message)s,%(details)s,%(further)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-
-    logger.addHandler(fh)
     if console_log:
-        logger.addHandler(ch)
-
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        ch.setFormatter(logging.Formatter(
+            "%(asctime)s,%(name)s,%(levelname)s,%(message)s,%(details)s,%(further)s",
+            defaults={"details": "", "further": ""}
+        ))
+        handlers.append(ch)
+
+    # The conversation loop only enqueues records; formatting and writes happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
     return logger
 
+def _atomic_write(path, data):
+    """Write bytes to a unique temp file with raw os.write calls, fsync it, then rename it over path."""
+    data = memoryview(data)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
 # Initialize Logger
 logger = make_logger(console_log=True)
 
@@ -51,12 +184,26 @@ class CustomerServiceSystem:
         self.OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
         self.DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
 
-        # Initialize API Clients
-        self.openai_client = openai.OpenAI(api_key=self.OPENAI_API_KEY)
-        self.deepgram = Deepgram(self.DEEPGRAM_API_KEY)
-
-        # Initialize pygame for audio playback
-        pygame.mixer.init()
+        # One HTTP/2 connection to Eleven Labs, kept alive across turns; the TTS workers'
+        # concurrent sentence requests are multiplexed over it
+        self.http = httpx.Client(
+            http2=True,
+            headers={
+                "Content-Type": "application/json",
+                "xi-api-key": self.ELEVENLABS_API_KEY or ""
+            },
+            timeout=httpx.Timeout(TTS_TIMEOUT, connect=TTS_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=TTS_WORKERS * 2)
+        )
+        atexit.register(self.http.close)
+
+        self._tts_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS)
+
+        # Meeting files are written off the conversation loop and drained at exit
+        self._write_queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self.drain_writes, name="meeting-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.stop_writer)
 
         # Create directories
         for folder in ["responses", "reviews", "audio_responses", "orders", "meetings"]:
@@ -73,165 +220,405 @@ class CustomerServiceSystem:
         # Load product catalog
         self.products = self.load_json_file('products.json', default=[])
         logger.info("Products Loaded", extra={"details": f"{len(self.products)} products", "further": ""})
+        self._product_list_str = ", ".join([p['name'] for p in self.products])
 
         # Load staff details
         self.staff = self.load_json_file('staff.json', default=[])
         logger.info("Staff Loaded", extra={"details": f"{len(self.staff)} staff members", "further": ""})
+        # Lookups for the meeting flow, built once instead of on every turn
+        self._staff_by_name_lower = {s['name'].lower(): s for s in self.staff}
+        self._staff_slots = {s['name']: {self.extract_time_from_text(t) or t: t for t in s['availability']} for s in self.staff}
+        self._staff_list_str = ", ".join([s["name"] for s in self.staff])
+        self._staff_times_str = {s['name']: ", ".join(s['availability']) for s in self.staff}
+
+        # Rule dispatch: one automaton pass finds every intent phrase and staff name in the input
+        self._keywords = self.build_keyword_automaton()
+        self._static_replies = {
+            "brand": self.store_info['store_description'],
+            "product": f"We have: {self._product_list_str}. Which one interests you?",
+            "order": "I can assist you in placing an order. What would you like to buy?",
+            "return": "Would you like to return a product? Please provide the name."
+        }
 
         # Context tracking
         self.conversation_history = []
 
+        # Semantic reply cache: unit embeddings in a ring buffer, each tagged with a digest of the
+        # turns that preceded its question
+        self._semantic_vectors = None
+        self._semantic_contexts = []
+        self._semantic_replies = []
+        self._semantic_next = 0
+
+        # Fixed lines are synthesized in the background at start-up, greeting first, so the
+        # first words and the silence/fallback prompts play without waiting on TTS
+        self.greeting = f"Welcome to {self.store_info['store_name']}! How may I assist you today?"
+        self._prefetched = {}
+        if self.ELEVENLABS_API_KEY and self.ELEVENLABS_VOICE_ID:
+            for line in (self.greeting, NO_INPUT_REPLY, NOOP_REPLY, FALLBACK_REPLY, FAREWELL, self._static_replies["product"]):
+                for sentence in _SENTENCE_END_RE.split(line):
+                    if sentence not in self._prefetched:
+                        self._prefetched[sentence] = self._tts_pool.submit(self.synthesize, sentence)
+
+    # API clients and the audio/SDK modules are imported on first use to keep start-up fast
+    @functools.cached_property
+    def openai_client(self):
+        import openai
+        return openai.OpenAI(api_key=self.OPENAI_API_KEY)
+
+    @functools.cached_property
+    def deepgram(self):
+        from deepgram import Deepgram
+        return Deepgram(self.DEEPGRAM_API_KEY)
+
     def load_json_file(self, filename, default):
         """Load JSON file or return default if not found."""
         try:
-            with open(filename, 'r') as f:
-                return json.load(f)
+            with open(filename, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+                    return orjson.loads(f.read())
+                # Parse large catalogs straight from the page cache instead of copying them first
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as buf:
+                    return orjson.loads(buf)
         except FileNotFoundError:
             logger.warning(f"{filename} not found. Using default values.")
             return default
 
+    def drain_writes(self):
+        """Writer thread: persist queued (path, bytes) pairs until the None sentinel."""
+        while (item := self._write_queue.get()) is not None:
+            path, data = item
+            try:
+                _atomic_write(path, data)
+            except OSError as e:
+                logger.error("Write Error", extra={"details": str(path), "further": str(e)})
+
+    def stop_writer(self):
+        self._write_queue.put(None)
+        self._writer.join()
+
+    @functools.cached_property
+    def pyaudio(self):
+        """PortAudio handle, created once since it enumerates every audio device."""
+        import pyaudio
+        audio = pyaudio.PyAudio()
+        atexit.register(audio.terminate)
+        return audio
+
+    def open_microphone(self):
+        """Open the default input as raw 16-bit mono PCM, the format Deepgram is told to expect."""
+        return self.pyaudio.open(
+            format=self.pyaudio.get_format_from_width(2),
+            channels=1,
+            rate=MIC_SAMPLE_RATE,
+            input=True,
+            frames_per_buffer=MIC_CHUNK
+        )
+
     def get_voice_input(self):
-        """Capture and transcribe speech using Deepgram STT."""
+        """Capture speech and transcribe it with Deepgram live streaming STT."""
         logger.info("Listening...", extra={"details": "User speaking", "further": ""})
 
         try:
-            with sr.Microphone() as source:
-                recognizer = sr.Recognizer()
-                recognizer.adjust_for_ambient_noise(source)
-                audio = recognizer.listen(source, timeout=8, phrase_time_limit=15)
-
-            # Convert audio to bytes
-            audio_data = audio.get_wav_data()
-
-            # Send to Deepgram for transcription
-            response = self.deepgram.transcription.sync_prerecorded(
-                {"buffer": audio_data, "mimetype": "audio/wav"},
-                {"model": "nova-2", "language": "en", "smart_format": True}
-            )
-
-            if 'results' in response and 'channels' in response['results']:
-                text = response['results']['channels'][0]['alternatives'][0]['transcript']
-                logger.info("STT Success", extra={"details": text, "further": ""})
-                return text.lower()
-            else:
-                logger.warning("No transcription result.")
-                return ""
-
+            text = asyncio.run(self.transcribe_live())
         except Exception as e:
             logger.error("STT Error", extra={"details": str(e), "further": ""})
             return ""
 
+        if text:
+            logger.info("STT Success", extra={"details": text, "further": ""})
+            return text.lower()
+        logger.warning("No transcription result.", extra={"details": "", "further": ""})
+        return ""
+
+    async def transcribe_live(self):
+        """Stream microphone PCM to Deepgram and return the utterance once it ends."""
+        loop = asyncio.get_running_loop()
+        speech_started = loop.create_future()
+        utterance_done = loop.create_future()
+        finals = []
+
+        def on_transcript(message):
+            if 'channel' not in message:  # closing metadata
+                return
+            transcript = message['channel']['alternatives'][0]['transcript']
+            if transcript and not speech_started.done():
+                speech_started.set_result(None)
+            if message.get('is_final') and transcript:
+                finals.append(transcript)
+            if message.get('speech_final') and finals and not utterance_done.done():
+                utterance_done.set_result(None)
+
+        socket = await self.deepgram.transcription.live(LIVE_OPTIONS)
+        try:
+            socket.register_handler(socket.event.TRANSCRIPT_RECEIVED, on_transcript)
+            stream = self.open_microphone()
+            try:
+                async def send_audio():
+                    while not utterance_done.done():
+                        socket.send(await asyncio.to_thread(stream.read, MIC_CHUNK, exception_on_overflow=False))
+
+                sender = asyncio.create_task(send_audio())
+                try:
+                    # Each wait also ends if the sender dies, rather than running out its timeout
+                    for awaited, timeout in ((speech_started, LISTEN_TIMEOUT), (utterance_done, PHRASE_TIME_LIMIT)):
+                        done, _ = await asyncio.wait({awaited, sender}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                        if awaited not in done:
+                            break
+                finally:
+                    if not utterance_done.done():
+                        utterance_done.set_result(None)
+                    # Let the in-flight read finish before the microphone is closed; re-raises a sender error
+                    await sender
+            finally:
+                stream.stop_stream()
+                stream.close()
+        finally:
+            await socket.finish()
+        return " ".join(finals)
+
     def generate_speech(self, text):
-        """Generate speech using Eleven Labs API and return audio file path."""
+        """Stream speech for text from the Eleven Labs API, yielding PCM chunks as they arrive.
+
+        Raises if the request fails or the stream breaks off, so a partial clip is never mistaken for a whole one.
+        """
         logger.info("Generating Speech", extra={"details": text, "further": ""})
 
-        print("ELEVENLABS_VOICE_ID", self.ELEVENLABS_VOICE_ID)
-        print("ELEVENLABS_API_KEY", self.ELEVENLABS_API_KEY)
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.ELEVENLABS_VOICE_ID}"
-        headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": self.ELEVENLABS_API_KEY
-        }
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.ELEVENLABS_VOICE_ID}/stream"
         data = {
             "text": text,
             "model_id": "eleven_monolingual_v1",
             "voice_settings": {"stability": 0.5, "similarity_boost": 0.5}
         }
-        try:
-            response = requests.post(url, json=data, headers=headers)
-            if response.status_code == 200:
-                filename = f"audio_responses/response_{int(time.time())}.mp3"
-                with open(filename, 'wb') as f:
-                    f.write(response.content)
-                return filename
-            else:
+        with self.http.stream("POST", url, params=TTS_PARAMS, json=data) as response:
+            if response.status_code != 200:
                 logger.error("TTS API Error", extra={"details": response.status_code, "further": ""})
-                return None
+                response.raise_for_status()
+            yield from response.iter_bytes(chunk_size=TTS_CHUNK_SIZE)
+
+    def synthesize(self, text):
+        """Return the complete PCM clip for text, or None if synthesis failed."""
+        # Cached by voice and text, so repeated lines skip the API across runs
+        key = hashlib.sha256(f"{self.ELEVENLABS_VOICE_ID}:{text}".encode()).hexdigest()
+        cache_file = Path('audio_responses') / f"{key}.pcm"
+        if cache_file.exists():
+            return cache_file.read_bytes()
+
+        try:
+            audio = b"".join(self.generate_speech(text))
         except Exception as e:
-            logger.error("TTS Error", extra={"details": str(e), "further": ""})
+            logger.error("TTS Error", extra={"details": str(e), "further": text})
             return None
-
-    def play_audio(self, audio_file):
-        """Play the generated audio response using pygame."""
+        if not audio:
+            return None
+        # Only complete clips reach the cache; the rename keeps readers from seeing a partial file
+        _atomic_write(cache_file, audio)
+        return audio
+
+    @functools.cached_property
+    def voice_channel(self):
+        """Mixer channel for replies, opened once per session; the end of each clip is posted as an event."""
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import pygame
+        pygame.display.init()  # the event queue belongs to the video subsystem
+        # PCM buffers are played as-is, so the mixer must not pick a different rate or channel count
+        pygame.mixer.init(frequency=TTS_SAMPLE_RATE, size=-16, channels=1, buffer=MIXER_BUFFER, allowedchanges=0)
+        channel = pygame.mixer.Channel(0)
+        channel.set_endevent(pygame.USEREVENT + 1)
+        return channel
+
+    def play_audio(self, audio):
+        """Play a raw PCM clip held in memory using pygame."""
         try:
-            pygame.mixer.init()
-            pygame.mixer.music.load(audio_file)
-            pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(10)
-            pygame.mixer.quit()
+            channel = self.voice_channel
+            import pygame
+            sound = pygame.mixer.Sound(buffer=audio)
+            channel.play(sound)
+            end_event = channel.get_endevent()
+            # Bounded by the clip length, so a lost end event can't hang the conversation loop
+            deadline = time.monotonic() + sound.get_length() + PLAYBACK_GRACE
+            while (remaining := deadline - time.monotonic()) > 0:
+                if pygame.event.wait(int(remaining * 1000) + 1).type == end_event:
+                    return
+            channel.stop()
+            logger.warning("Playback end event missing", extra={"details": f"{sound.get_length():.1f}s clip", "further": ""})
         except Exception as e:
             logger.error("Audio Playback Error", extra={"details": str(e), "further": ""})
 
-    def normalize_time(self, time_str):
-        """Convert various time formats to a standard format (HH:MM AM/PM)"""
-        time_str = time_str.lower().strip()
-        
-        # Remove dots and extra spaces
-        time_str = time_str.replace('.', '').replace('  ', ' ')
-        
-        # Handle "10am" -> "10:00 AM" format
-        if 'am' in time_str or 'pm' in time_str:
-            # Remove spaces before am/pm
-            time_str = time_str.replace(' am', 'am').replace(' pm', 'pm')
-            
-            # Extract hours
-            hours = time_str.replace('am', '').replace('pm', '').strip()
-            if ':' not in hours:
-                hours = f"{hours}:00"
-            
-            # Add proper spacing and capitalization for AM/PM
-            if 'am' in time_str:
-                return f"{hours} AM"
-            return f"{hours} PM"
-        
-        # Handle "10" -> "10:00 AM" format
-        if time_str.isdigit():
-            hour = int(time_str)
-            if hour < 12:
-                return f"{hour}:00 AM"
-            elif hour == 12:
-                return "12:00 PM"
-            else:
-                return f"{hour-12}:00 PM"
-        
-        return time_str.upper()
+    def queue_sentence(self, replies, sentence):
+        """Start synthesizing a sentence, unless it was prefetched, and queue it for playback."""
+        clip = self._prefetched.get(sentence)
+        if clip is not None and clip.done() and (clip.exception() is not None or clip.result() is None):
+            # A failed prefetch is retried rather than silencing the line for the rest of the run
+            clip = self._prefetched[sentence] = self._tts_pool.submit(self.synthesize, sentence)
+        elif clip is None:
+            clip = self._tts_pool.submit(self.synthesize, sentence)
+        replies.put((sentence, clip))
+
+    def play_replies(self, replies, echo=False):
+        """Play queued sentences in order until the None sentinel; later ones synthesize while earlier ones play."""
+        while (item := replies.get()) is not None:
+            sentence, clip = item
+            if echo:
+                print(sentence, end=" ", flush=True)
+            audio = clip.result()
+            if audio:
+                self.play_audio(audio)
+        if echo:
+            print()
+
+    def speak(self, text):
+        """Voice text one sentence at a time."""
+        replies = queue.SimpleQueue()
+        for sentence in _SENTENCE_END_RE.split(text.strip()):
+            if sentence:
+                self.queue_sentence(replies, sentence)
+        replies.put(None)
+        self.play_replies(replies)
+
+    def dialog_context(self):
+        """Digest of the last few turns; a cached reply is only reused after the same ones."""
+        recent = self.conversation_history[-SEMANTIC_CONTEXT_TURNS:]
+        return hashlib.blake2b(orjson.dumps(recent), digest_size=16).digest()
+
+    def embed(self, text):
+        """Unit embedding of text, or None if the request fails."""
+        import numpy as np
+
+        try:
+            response = self.openai_client.with_options(timeout=EMBEDDING_TIMEOUT, max_retries=0).embeddings.create(
+                model=EMBEDDING_MODEL, input=text
+            )
+        except Exception as e:
+            logger.error("Embedding Error", extra={"details": str(e), "further": ""})
+            return None
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def get_semantic_reply(self, vector, context):
+        """Cached reply for the nearest earlier question asked in the same context, if it is close enough."""
+        if self._semantic_vectors is None:
+            return None
+        import numpy as np
+
+        scores = self._semantic_vectors[:len(self._semantic_replies)] @ vector
+        scores[np.fromiter((c != context for c in self._semantic_contexts), dtype=bool)] = -1.0
+        best = int(scores.argmax())
+        if scores[best] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        return self._semantic_replies[best]
+
+    def cache_semantic_reply(self, vector, context, reply):
+        import numpy as np
+
+        if self._semantic_vectors is None:
+            self._semantic_vectors = np.empty((SEMANTIC_CACHE_SIZE, vector.shape[0]), dtype=np.float32)
+        i = self._semantic_next
+        self._semantic_vectors[i] = vector
+        if i < len(self._semantic_replies):
+            self._semantic_contexts[i] = context
+            self._semantic_replies[i] = reply
+        else:
+            self._semantic_contexts.append(context)
+            self._semantic_replies.append(reply)
+        self._semantic_next = (i + 1) % SEMANTIC_CACHE_SIZE
+
+    def generate_reply(self, user_input, replies):
+        """LLM thread: reuse a cached reply to a paraphrase, or stream a completion and queue each
+        sentence for TTS as soon as it is complete."""
+        context = self.dialog_context()
+        self.conversation_history.append({"role": "user", "content": user_input})
+        full_reply = ""
+        buffer = ""
+        try:
+            vector = self.embed(user_input)
+            cached = self.get_semantic_reply(vector, context) if vector is not None else None
+            if cached is not None:
+                logger.info("Semantic Cache Hit", extra={"details": user_input, "further": ""})
+                full_reply = cached
+                for sentence in _SENTENCE_END_RE.split(cached.strip()):
+                    if sentence.strip():
+                        self.queue_sentence(replies, sentence.strip())
+                return
+
+            response_stream = self.openai_client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    *self.conversation_history
+                ],
+                stream=True
+            )
+            for chunk in response_stream:
+                if not (chunk.choices and chunk.choices[0].delta.content):
+                    continue
+                content = chunk.choices[0].delta.content
+                full_reply += content
+                *sentences, buffer = _SENTENCE_END_RE.split(buffer + content)
+                if not sentences and len(buffer) > SENTENCE_FLUSH_CHARS and " " in buffer:
+                    clause, buffer = buffer.rsplit(" ", 1)
+                    sentences = [clause]
+                for sentence in sentences:
+                    if sentence.strip():
+                        self.queue_sentence(replies, sentence.strip())
+            if buffer.strip():
+                self.queue_sentence(replies, buffer.strip())
+            if full_reply and vector is not None:
+                self.cache_semantic_reply(vector, context, full_reply)
+        except Exception as e:
+            logger.error("LLM Error", extra={"details": str(e), "further": ""})
+            if not full_reply:
+                full_reply = FALLBACK_REPLY
+                self.queue_sentence(replies, FALLBACK_REPLY)
+        finally:
+            self.conversation_history.append({"role": "assistant", "content": full_reply})
+            del self.conversation_history[:-MAX_HISTORY]
+            replies.put(None)
+
+    def stream_reply(self, user_input):
+        """Voice an LLM reply while it is still being generated."""
+        replies = queue.SimpleQueue()
+        threading.Thread(target=self.generate_reply, args=(user_input, replies), daemon=True).start()
+        print("AI:", end=" ", flush=True)
+        self.play_replies(replies, echo=True)
 
     def extract_time_from_text(self, text):
         """Extract time from a natural language sentence and normalize it."""
-        text = text.lower()
-        words = text.split()
-        
-        # Look for time patterns in the text
-        for i, word in enumerate(words):
-            # Check for patterns like "9pm", "9 pm", "9:00pm", "9:00 pm"
-            if any(period in word for period in ['am', 'pm']):
-                return self.normalize_time(word)
-            
-            # Check for patterns like "at 9" or "for 9"
-            if word in ['at', 'for', 'around'] and i + 1 < len(words):
-                next_word = words[i + 1]
-                if next_word.replace(':', '').replace('.', '').isdigit():
-                    # Check if AM/PM is in the following word
-                    if i + 2 < len(words) and any(period in words[i + 2].lower() for period in ['am', 'pm']):
-                        return self.normalize_time(f"{next_word} {words[i + 2]}")
-                    else:
-                        return self.normalize_time(next_word)
-        
+        if not _HAS_DIGIT(text):
+            return None
+        for match in _TIME_RE.finditer(text.translate(_STRIP_DOTS)):
+            # A bare number only counts as a time after "at", "for" or "around"
+            if match.group('prep') or match.group('period'):
+                return _format_time(*match.group('hour', 'minute', 'period'))
         return None
 
+    def build_keyword_automaton(self):
+        automaton = ahocorasick.Automaton()
+        for phrase, intent in INTENT_KEYWORDS.items():
+            automaton.add_word(phrase, (intent, phrase))
+        for name_lower in self._staff_by_name_lower:
+            automaton.add_word(name_lower, ('staff', name_lower))
+        automaton.make_automaton()
+        return automaton
+
+    def scan_keywords(self, user_input):
+        """Find every intent phrase and staff name in one pass; returns {category: [values]}."""
+        hits = {}
+        for _, (category, value) in self._keywords.iter(user_input.lower()):
+            hits.setdefault(category, []).append(value)
+        return hits
+
     def handle_query(self, user_input):
         """Process user input and generate meaningful responses dynamically."""
         # Track conversation state
         if not hasattr(self, 'conversation_state'):
             self.conversation_state = {'state': None, 'data': {}}
+        hits = self.scan_keywords(user_input)
         
         # Initial meeting request
-        if "meeting" in user_input and self.conversation_state['state'] is None:
-            staff_names = ", ".join([s["name"] for s in self.staff])
+        if 'meeting' in hits and self.conversation_state['state'] is None:
             self.conversation_state['state'] = 'meeting_requested'
-            return f"Available staff members are: {staff_names}. Please specify who you'd like to meet with and your preferred time."
+            return f"Available staff members are: {self._staff_list_str}. Please specify who you'd like to meet with and your preferred time."
         
         # Handle meeting details
         if self.conversation_state['state'] == 'meeting_requested':
@@ -243,11 +630,7 @@ class CustomerServiceSystem:
                 # Extract and normalize time from the sentence
                 extracted_time = self.extract_time_from_text(user_input)
                 if extracted_time:
-                    # Try to match with available times
-                    for time in matched_staff['availability']:
-                        if self.normalize_time(time) == extracted_time:
-                            matched_time = time
-                            break
+                    matched_time = self._staff_slots[matched_staff['name']].get(extracted_time)
                 
                 if matched_time:
                     # Store meeting
@@ -259,79 +642,67 @@ class CustomerServiceSystem:
                         'created_at': datetime.now().isoformat()
                     }
                     
-                    # Save meeting to file
+                    # Save meeting to file on the writer thread
                     meetings_file = Path('meetings') / f'{meeting_id}.json'
-                    with open(meetings_file, 'w') as f:
-                        json.dump(meeting_data, f)
+                    self._write_queue.put((meetings_file, orjson.dumps(meeting_data)))
                     
                     # Reset conversation state
                     self.conversation_state = {'state': None, 'data': {}}
                     
                     return f"Great! I've scheduled your meeting with {matched_staff['name']} at {matched_time}."
                 else:
-                    available_times = ", ".join(matched_staff['availability'])
-                    return f"I couldn't match that time. Available times for {matched_staff['name']} are: {available_times}. Please specify your preferred time."
+                    return f"I couldn't match that time. Available times for {matched_staff['name']} are: {self._staff_times_str[matched_staff['name']]}. Please specify your preferred time."
             
             # If no staff selected yet, try to match staff name
             else:
-                for staff in self.staff:
-                    if staff['name'].lower() in user_input.lower():
-                        self.conversation_state['data']['selected_staff'] = staff
-                        available_times = ", ".join(staff['availability'])
-                        return f"I found {staff['name']}. Their available times are: {available_times}. Please specify your preferred time."
+                if 'staff' in hits:
+                    staff = self._staff_by_name_lower[hits['staff'][0]]
+                    self.conversation_state['data']['selected_staff'] = staff
+                    return f"I found {staff['name']}. Their available times are: {self._staff_times_str[staff['name']]}. Please specify your preferred time."
                 
-                staff_names = ", ".join([s["name"] for s in self.staff])
-                return f"I couldn't find that staff member. Available staff are: {staff_names}. Please try again."
-
-        if "about your brand" in user_input or "tell me about" in user_input:
-            return self.store_info['store_description']
+                return f"I couldn't find that staff member. Available staff are: {self._staff_list_str}. Please try again."
 
-        if "product" in user_input or "list" in user_input:
-            product_list = ", ".join([p['name'] for p in self.products])
-            return f"We have: {product_list}. Which one interests you?"
+        for intent in STATIC_INTENTS:
+            if intent in hits:
+                return self._static_replies[intent]
 
-        if "order" in user_input:
-            return "I can assist you in placing an order. What would you like to buy?"
-
-        if "return" in user_input:
-            return "Would you like to return a product? Please provide the name."
+        # Acknowledgements get a canned prompt instead of an LLM round trip, unless they answer a question
+        utterance = user_input.strip(_UTTERANCE_PUNCTUATION)
+        if not utterance or (utterance in NOOP_UTTERANCES and not self.awaiting_answer()):
+            return NOOP_REPLY
+        return None
 
-        return "I'm not quite sure about that. Can you clarify?"
+    def awaiting_answer(self):
+        """Whether the last reply voiced by the LLM asked the caller something."""
+        history = self.conversation_history
+        return bool(history) and history[-1]["role"] == "assistant" and history[-1]["content"].rstrip().endswith("?")
 
     def run_conversation(self):
         """Main voice-based conversation loop with the customer."""
         logger.info("Starting conversation...", extra={"details": "", "further": ""})
 
-        greeting = f"Welcome to {self.store_info['store_name']}! How may I assist you today?"
-        print(f"AI: {greeting}")
-        audio_file = self.generate_speech(greeting)
-        if audio_file:
-            self.play_audio(audio_file)
+        print(f"AI: {self.greeting}")
+        self.speak(self.greeting)
 
         while True:
             user_input = self.get_voice_input()
             if not user_input:
-                response = "I didn't catch that, could you repeat?"
                 logger.warning("No User Input")
-                print(f"AI: {response}")
-                audio_file = self.generate_speech(response)
-                if audio_file:
-                    self.play_audio(audio_file)
+                print(f"AI: {NO_INPUT_REPLY}")
+                self.speak(NO_INPUT_REPLY)
                 continue
 
-            if "exit" in user_input or "goodbye" in user_input:
-                farewell = "Goodbye! Have a great day!"
-                print(f"AI: {farewell}")
-                audio_file = self.generate_speech(farewell)
-                if audio_file:
-                    self.play_audio(audio_file)
+            if _EXIT_RE.search(user_input):
+                print(f"AI: {FAREWELL}")
+                self.speak(FAREWELL)
                 break
 
             response = self.handle_query(user_input)
+            if response is None:
+                self.stream_reply(user_input)
+                continue
             print(f"AI: {response}")
-            audio_file = self.generate_speech(response)
-            if audio_file:
-                self.play_audio(audio_file)
+            self.speak(response)
 
 
 if __name__ == "__main__":
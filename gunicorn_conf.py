@@ -0,0 +1,16 @@
+# Production server settings for the API: gunicorn -c gunicorn_conf.py api:app
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+# Sessions, product stock and the delayed products.json save live in each worker's memory,
+# so a single worker is the only safe default until they move to shared storage
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+
+# api.py is an ASGI app, so each worker runs its own asyncio event loop
+worker_class = "uvicorn_worker.UvicornWorker"
+
+keepalive = 30
+
+# For Uvicorn workers this is a liveness heartbeat from the worker process, not a
+# per-request limit, so long LLM/TTS streams are unaffected; hung workers still get restarted
+timeout = 60